@@ -0,0 +1,51 @@
+'''
+Times building very large generated workflows. Run directly: `python benchmarks.py [steps]`.
+'''
+import sys
+import timeit
+from workflow_graphs import WorkflowGraph, End, anything_else, do_nothing
+
+
+def step_generator(index):
+    def step(ctx, actor, env):
+        pass
+    return step
+
+
+def value_in_context(ctx, actor, env):
+    return ctx.get("case")
+
+
+def build_linear(steps):
+    # One step at a time, labelling as we go.
+    flow = WorkflowGraph().begin_with(do_nothing)
+    for index in range(steps):
+        flow.then(step_generator(index)).call_that_step(index)
+    return flow.then(End)
+
+
+def build_bulk(steps):
+    return WorkflowGraph().begin_with(do_nothing).then_all(step_generator(index) for index in range(steps)).then(End)
+
+
+def build_nested_decisions(steps, depth=100):
+    # Decisions nested `depth` deep, with labelled steps spread evenly across the innermost cases.
+    flow = WorkflowGraph().begin_with(do_nothing)
+    steps_per_level = steps // depth
+    for level in range(depth):
+        flow.decide_on(value_in_context).when(anything_else)
+        for index in range(steps_per_level):
+            flow.then(step_generator(index)).call_that_step((level, index))
+    for level in range(depth):
+        flow.join()
+    return flow.then(End)
+
+
+def main(steps=100000):
+    for builder in [build_linear, build_bulk, build_nested_decisions]:
+        seconds = min(timeit.repeat(lambda: builder(steps), number=1, repeat=3))
+        print("{0}: {1} steps in {2:.3f}s".format(builder.__name__, steps, seconds))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -1,7 +1,11 @@
 import unittest
 from asp import AdviceBuilder
-from workflow_graphs import WorkflowGraph, End, anything_else, do_nothing
-from workflow_graphs import Actor, Department
+from workflow_graphs import WorkflowGraph, End, anything_else, do_nothing, pure
+from workflow_graphs.workflow_utilities import BadWorkflowFormation, ReplayDivergenceException
+from workflow_graphs import Actor, Department, SimulationMetrics, multicast
+from workflow_graphs.GraphActor import MessagingActor
+from workflow_graphs import SchedulingRecorder, SchedulingReplayer
+from workflow_graphs.replay import RecordingSchedule, ReplayingSchedule, DECISION
 from au import Clock, default_cost
 from pydysofu import duplicate_last_step, fuzz
 
@@ -179,6 +183,150 @@ class TestWorkflowGraphMethods(unittest.TestCase):
         self.assertEqual(flow.index_of(action_to_find), [1, 1, 0, 1])
 
 
+class TestBulkBuilding(unittest.TestCase):
+
+    def test_then_all(self):
+        flow = WorkflowGraph()
+        flow.begin_with(add_value_to_ctx(1)) \
+            .then_all([add_one_to_value] * 3) \
+            .then(End)
+
+        ctx = dict()
+        flow(ctx, dict())
+
+        self.assertEqual(ctx["stored_value"], 4)
+
+    def test_decide_between(self):
+        flow = WorkflowGraph()
+        flow.begin_with(add_value_to_ctx(1)) \
+            .decide_between(value_in_context("stored_value"),
+                            {anything_else: write_to_context("matched", "no!"),
+                             1: [add_one_to_value, write_to_context("matched", "yes!")]}) \
+            .then(End)
+
+        ctx = dict()
+        flow(ctx, dict())
+
+        self.assertEqual(ctx["matched"], "yes!")
+        self.assertEqual(ctx["stored_value"], 2)
+
+    def test_decide_between_accepts_generators(self):
+        flow = WorkflowGraph()
+        flow.begin_with(add_value_to_ctx(1)) \
+            .decide_between(value_in_context("stored_value"),
+                            [(anything_else, (step for step in [add_one_to_value, add_one_to_value]))]) \
+            .then(End)
+
+        ctx = dict()
+        flow(ctx, dict())
+
+        self.assertEqual(ctx["stored_value"], 3)
+
+    def test_steps_in_decisions_need_a_case(self):
+        flow = WorkflowGraph().begin_with(add_value_to_ctx(1)).decide_on(value_in_context("stored_value"))
+
+        self.assertRaises(BadWorkflowFormation, flow.then, add_one_to_value)
+        self.assertRaises(BadWorkflowFormation, flow.then_all, [add_one_to_value])
+
+    def test_labelling_inside_nested_decisions(self):
+        incrementing = add_one_to_value
+
+        flow = WorkflowGraph()
+        flow.begin_with(add_value_to_ctx(1)) \
+            .decide_on(value_in_context("stored_value")) \
+            .when(anything_else) \
+            .then(write_to_context("value_was_equal_to_5", "unknown")) \
+            .decide_on(value_in_context("stored_value")) \
+            .when(anything_else) \
+            .then(incrementing) \
+            .call_that_step("incrementing") \
+            .join() \
+            .join()
+
+        self.assertTrue(flow.label_action_mapping["incrementing"] is incrementing)
+        self.assertEqual(flow.index_of(incrementing), [1, anything_else, 1, anything_else, 0])
+
+
+class TestPureFunctions(unittest.TestCase):
+
+    def test_pure_condition_skipped_on_cache_hit(self):
+        calls = []
+
+        @pure(ctx_keys=["stored_value"])
+        def stored_value_condition(ctx, actor, env):
+            calls.append(ctx["stored_value"])
+            return ctx["stored_value"]
+
+        flow = WorkflowGraph()
+        flow.begin_with(add_value_to_ctx(1)) \
+            .decide_on(stored_value_condition) \
+            .when(1).then(write_to_context("matched", "yes!")) \
+            .when(anything_else).then(write_to_context("matched", "no!")) \
+            .join() \
+            .then(End)
+
+        for _ in range(3):
+            ctx = dict()
+            flow(ctx, dict())
+            self.assertEqual(ctx["matched"], "yes!")
+
+        self.assertEqual(calls, [1])
+        self.assertEqual(stored_value_condition.cache.misses, 1)
+        self.assertEqual(stored_value_condition.cache.hits, 2)
+
+    def test_pure_action_writes_back_on_cache_hit(self):
+
+        @pure(ctx_keys=["x"], writes_ctx=["y"])
+        def derive(ctx, actor, env):
+            ctx["y"] = ctx["x"] * 2
+
+        flow = WorkflowGraph().begin_with(write_to_context("x", 3)).then(derive).then(End)
+
+        for _ in range(2):
+            ctx = dict()
+            flow(ctx, dict())
+            self.assertEqual(ctx, {"x": 3, "y": 6})
+
+        self.assertEqual(derive.cache.hits, 1)
+
+    def test_pure_action_writes_are_copied(self):
+
+        @pure(ctx_keys=["x"], writes_ctx=["items"])
+        def make_items(ctx, actor, env):
+            ctx["items"] = [ctx["x"]]
+
+        first_ctx, second_ctx, third_ctx = {"x": 1}, {"x": 1}, {"x": 1}
+        make_items(first_ctx, dict(), dict())
+        first_ctx["items"].append(99)
+        make_items(second_ctx, dict(), dict())
+        make_items(third_ctx, dict(), dict())
+
+        self.assertEqual(second_ctx["items"], [1])
+        self.assertFalse(second_ctx["items"] is third_ctx["items"])
+
+    def test_pure_distinguishes_missing_keys_from_none(self):
+
+        @pure(ctx_keys=["x"])
+        def has_x(ctx, actor, env):
+            return "x" in ctx
+
+        self.assertFalse(has_x(dict(), dict(), dict()))
+        self.assertTrue(has_x({"x": None}, dict(), dict()))
+
+    def test_pure_cache_is_bounded(self):
+
+        @pure(actor_keys=["val"], max_size=2)
+        def double_val(ctx, actor, env):
+            return actor["val"] * 2
+
+        for val in [1, 2, 3, 1]:
+            self.assertEqual(double_val(dict(), {"val": val}, dict()), val * 2)
+
+        # 1 was evicted when 3 arrived, so all four calls missed.
+        self.assertEqual(double_val.cache.misses, 4)
+        self.assertEqual(len(double_val.cache.results), 2)
+
+
 class TestFuzzing(unittest.TestCase):
     def test_asp_fuzzing(self):
         # Skip the second action.
@@ -300,3 +448,177 @@ class TestAUTimingModel(unittest.TestCase):
 
         self.assertTrue(WorkflowGraph.environment["message"] == "ping pong ping pong ")
 
+
+class TestBulkMessaging(unittest.TestCase):
+    def drain(self, queue):
+        messages = []
+        while not queue.empty():
+            messages.append(queue.get())
+        return messages
+
+    def test_recieve_messages_keeps_order(self):
+        clock = Clock(max_ticks=1)
+        actor = Actor(clock)
+        dept = Department()
+
+        actor.recieve_message("first")
+        actor.recieve_messages(["second", "third"])
+        dept.recieve_messages(iter(["first", "second"]))
+
+        self.assertEqual(self.drain(actor.inbox), ["first", "second", "third"])
+        self.assertEqual(self.drain(dept.department_work_queue), ["first", "second"])
+
+    def test_send_messages_action_resends_batch(self):
+        clock = Clock(max_ticks=1)
+        sender = MessagingActor()
+        recipient = Actor(clock)
+
+        send = sender.send_messages_action(recipient, (message for message in ["first", "second"]))
+        send(dict(), dict(), dict())
+        send(dict(), dict(), dict())
+
+        self.assertEqual(self.drain(recipient.inbox), ["first", "second", "first", "second"])
+
+    def test_multicast_shares_message(self):
+        clock = Clock(max_ticks=1)
+        actors = [Actor(clock) for _ in range(3)]
+        dept = Department()
+        message = {"notice": "all hands"}
+
+        multicast(actors + [dept, actors[0]], message)
+
+        self.assertEqual([len(self.drain(actor.inbox)) for actor in actors], [2, 1, 1])
+        self.assertTrue(dept.department_work_queue.get() is message)
+
+
+class TestMetrics(unittest.TestCase):
+    def test_actor_utilisation_and_latency(self):
+        flow = WorkflowGraph()
+        flow.begin_with(set_actor_value)
+        flow.then(increment_actor_value)
+        flow.then(End)
+
+        clock = Clock(max_ticks=5)
+        metrics = SimulationMetrics(clock)
+        actor = Actor(clock)
+
+        metrics.watch_actor(actor)
+        actor.recieve_message(flow)
+
+        clock.tick()
+
+        self.assertEqual(actor.actor_state["val"], 2)
+        self.assertEqual(metrics.latency(actor).count, 1)
+        self.assertTrue(0 < metrics.utilisation(actor) < 1)
+        self.assertTrue(metrics.recent_activity(actor)[0])
+        self.assertFalse(metrics.recent_activity(actor)[-1])
+        self.assertEqual(metrics.queue_depths(actor)[-1], (4, 0))
+
+    def test_department_queue_depths(self):
+        clock = Clock(max_ticks=3)
+        dept = Department()
+        metrics = SimulationMetrics(clock)
+        metrics.watch_department(dept)
+
+        # Nobody works for this department, so its work piles up.
+        for _ in range(4):
+            dept.recieve_message("WORK")
+
+        clock.tick()
+
+        self.assertEqual(metrics.queue_depths(dept), [(0, 4), (1, 4), (2, 4)])
+        self.assertEqual(metrics.busiest_queues(), [dept])
+        self.assertEqual(metrics.latency(dept).count, 0)
+
+
+def val_in_actor_state_condition(may_run=True):
+    @default_cost(1)
+    def val_in_actor_state(ctx, actor, env):
+        if not may_run:
+            raise AssertionError("Condition ran during replay")
+        return actor["val"]
+    return val_in_actor_state
+
+
+class TestRecordReplay(unittest.TestCase):
+    def run_counting_actor(self, scheduling, condition, departments=1):
+        flow = WorkflowGraph()
+        flow.begin_with(set_actor_value) \
+            .then(increment_actor_value) \
+            .call_that_step("incrementing") \
+            .decide_on(condition) \
+            .when(3).then(End) \
+            .when(anything_else).move_to_step_called("incrementing") \
+            .join()
+
+        clock = Clock(max_ticks=10)
+        actor = Actor(clock)
+        depts = [Department() for _ in range(departments)]
+        for dept in depts:
+            dept.add_member(actor)
+        scheduling.watch_actor(actor)
+        depts[-1].recieve_message(flow)
+
+        clock.tick()
+        return actor
+
+    def record(self, departments=1):
+        recorder = SchedulingRecorder()
+        self.run_counting_actor(recorder, val_in_actor_state_condition(), departments)
+        return recorder.logs
+
+    def test_replay_skips_conditions(self):
+        replayer = SchedulingReplayer(self.record())
+        replayed_actor = self.run_counting_actor(replayer, val_in_actor_state_condition(may_run=False))
+        self.assertEqual(replayed_actor.actor_state["val"], 3)
+        self.assertTrue(replayer.exhausted)
+
+    def test_recording_merges_repeated_events(self):
+        # The actor idles for every tick after its workflow ends, logged as a single event.
+        kind, value, first_tick, last_tick, count = self.record()[0][-1]
+        self.assertEqual(value, None)
+        self.assertEqual(last_tick, 9)
+        self.assertEqual(count, last_tick - first_tick + 1)
+
+    def test_recording_keeps_gaps_between_ticks(self):
+        clock = Clock()
+        log = list()
+        schedule = RecordingSchedule(log, clock)
+        decision = {"condition_function": val_in_actor_state_condition(), "cases": [[anything_else]]}
+
+        for tick in [0, 0, 0, 3]:
+            clock.ticks_passed = tick
+            schedule.decide(decision, dict(), {"val": 7}, dict())
+
+        self.assertEqual([event[2:] for event in log], [(0, 0, 3), (3, 3, 1)])
+
+    def test_replay_goes_live_at_until_tick(self):
+        # Going live from the start, the replayed run's conditions must run.
+        replayer = SchedulingReplayer(self.record(), until_tick=0)
+        replayed_actor = self.run_counting_actor(replayer, val_in_actor_state_condition())
+        self.assertEqual(replayed_actor.actor_state["val"], 3)
+        self.assertFalse(replayer.exhausted)
+
+    def test_replay_divergence(self):
+        @default_cost(1)
+        def another_condition(ctx, actor, env):
+            return actor["val"]
+
+        self.assertRaises(ReplayDivergenceException,
+                          self.run_counting_actor, SchedulingReplayer(self.record()), another_condition)
+
+        # A result none of the decision's cases match.
+        condition = val_in_actor_state_condition(may_run=False)
+        schedule = ReplayingSchedule([(DECISION, ("val_in_actor_state", 42), 0, 0, 1)], Clock())
+        decision = {"condition_function": condition, "cases": [[3, End]]}
+        self.assertRaises(ReplayDivergenceException, schedule.decide, decision, dict(), dict(), dict())
+
+        # Fewer departments than were recorded.
+        self.assertRaises(ReplayDivergenceException,
+                          self.run_counting_actor, SchedulingReplayer(self.record(departments=2)),
+                          val_in_actor_state_condition())
+
+        # More actors than were recorded.
+        replayer = SchedulingReplayer(self.record())
+        replayer.watch_actor(Actor(Clock()))
+        self.assertRaises(ReplayDivergenceException, replayer.watch_actor, Actor(Clock()))
@@ -1,8 +1,57 @@
 from Queue import Queue
+from collections import OrderedDict
 from au import construct_task
 from workflow import WorkflowGraph, End, do_nothing
 
 
+def mailbox_of(recipient):
+    '''
+    :param recipient: An actor or Department.
+    :return: The queue messages for that recipient are put on.
+    '''
+    if isinstance(recipient, Department):
+        return recipient.department_work_queue
+    return recipient.inbox
+
+
+def put_all(queue, messages):
+    '''
+    Puts each message on a queue in order, taking the queue's lock once for the whole batch rather than once per message.
+    Bounded queues may need to block part way through, so they fall back to putting messages one at a time.
+    '''
+    messages = list(messages)
+    if len(messages) is 0:
+        return
+
+    if queue.maxsize > 0:
+        for message in messages:
+            queue.put(message, block=True)
+        return
+
+    queue.not_full.acquire()
+    try:
+        for message in messages:
+            queue._put(message)
+        queue.unfinished_tasks += len(messages)
+        queue.not_empty.notify(len(messages))
+    finally:
+        queue.not_full.release()
+
+
+def multicast(recipients, message):
+    '''
+    Sends the same message object to many actors and departments, with one batched put per mailbox.
+    A recipient named more than once gets the message more than once, as it would from sequential sends.
+    '''
+    messages_per_mailbox = OrderedDict()
+    for recipient in recipients:
+        mailbox = mailbox_of(recipient)
+        messages_per_mailbox.setdefault(mailbox, []).append(message)
+
+    for mailbox, messages in messages_per_mailbox.items():
+        put_all(mailbox, messages)
+
+
 class MessagingActor(object):
     def __init__(self, *args, **kwargs):
         self.inbox = Queue()
@@ -10,13 +59,24 @@ class MessagingActor(object):
 
     def send_message_action(self, other_actor, message):
         def send_message(ctx, actor, env):
-            if isinstance(other_actor, Department):
-                other_actor.department_work_queue.put(message, block=True)
-            else:
-                other_actor.inbox.put(message, block=True)
+            mailbox_of(other_actor).put(message, block=True)
 
         return send_message
 
+    def send_messages_action(self, other_actor, messages):
+        messages = list(messages)  # So every run of the action sends the whole batch, even if given a generator.
+
+        def send_messages(ctx, actor, env):
+            put_all(mailbox_of(other_actor), messages)
+
+        return send_messages
+
+    def multicast_message_action(self, recipients, message):
+        def multicast_message(ctx, actor, env):
+            multicast(recipients, message)
+
+        return multicast_message
+
 
 
 class Signal(object):
@@ -52,6 +112,9 @@ class Department(object):
     def recieve_message(self, message):
         self.department_work_queue.put(message)
 
+    def recieve_messages(self, messages):
+        put_all(self.department_work_queue, messages)
+
 
 class Actor(TeamMember):
     def __init__(self, clock, name=None, *args, **kwargs):
@@ -68,47 +131,53 @@ class Actor(TeamMember):
         self.action_generator = None
         self.current_workflow = None
         self.current_task = None
+        self.metrics = None  # Set by SimulationMetrics.watch_actor()
+        self.scheduler = None  # Set by SchedulingRecorder.watch_actor() or SchedulingReplayer.watch_actor()
         
         self.name = name  # Not necessary, just useful for ID sometimes.
         
     def on_signal_process_workflow(self, signal, workflow):
         self.signal_flow_mapping[signal] = workflow
 
+    def next_work_source(self):
+        '''
+        Picks where our next workflow comes from: anything handed to us personally comes first, then the first of our
+        departments with work waiting.
+        :return: The queue to take our next workflow from, or None if there's nothing to do.
+        '''
+        if not self.inbox.empty():
+            return self.inbox
+
+        for dept in self.departments:
+            if not dept.department_work_queue.empty():
+                return dept.department_work_queue
+
+        return None
+
     def get_next_workflow(self):
 
         self.context = {"incoming message": None}  # A new context for every workflow invocation
 
         flow = None
 
-        # Anything handed to us personally?
-        if not self.inbox.empty():
-            flow = self.inbox.get(block=True)
+        if self.scheduler is None:
+            source = self.next_work_source()
+        else:
+            source = self.scheduler.choose_source(self)
+
+        if source is not None:
+            flow = source.get(block=True)
 
             # If the flow's not a graph, it's some sort of signal, so resolve it from our mapping.
             if not isinstance(flow, WorkflowGraph):
                 self.context = {"incoming message": flow}
                 flow = self.signal_flow_mapping[flow]
 
-        else:
-            found_work = False
-
-            for dept in self.departments:
-                if not found_work and not dept.department_work_queue.empty():
-
-                    found_work = True
-
-                    flow = dept.department_work_queue.get(block=True)
-
-                    # If the flow's not a graph, it's some sort of signal, so resolve it from our mapping.
-                    if not isinstance(flow, WorkflowGraph):
-                        self.context = {"incoming message": flow}
-                        flow = self.signal_flow_mapping[flow]
-
         if flow is None:
             flow = self.idle_flow
 
         self.current_workflow = flow
-        self.action_generator = self.current_workflow.yield_actions(self.context, self.actor_state)
+        self.action_generator = self.current_workflow.yield_actions(self.context, self.actor_state, self.scheduler)
 
     def get_next_task(self):
         '''
@@ -139,6 +208,9 @@ class Actor(TeamMember):
     def recieve_message(self, message):
         self.inbox.put(message)
 
+    def recieve_messages(self, messages):
+        put_all(self.inbox, messages)
+
     def perform(self):
         while True:
             task, ctx, actor, env = self.get_next_task()
@@ -147,6 +219,8 @@ class Actor(TeamMember):
             # task.invocations is reset to 0 if enough invocations == associated cost (or always 0 if no cost)
             completed = False
             while not completed:
+                if self.metrics is not None:
+                    self.metrics.record_actor_tick(self, busy=self.current_workflow is not self.idle_flow)
                 yield task(ctx, actor, env)
                 completed = task.just_ran()
 
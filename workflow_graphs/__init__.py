@@ -1,3 +1,5 @@
 from workflow import WorkflowGraph
-from workflow_utilities import anything_else, do_nothing, End
-from GraphActor import Actor, Department
+from workflow_utilities import anything_else, do_nothing, End, pure
+from GraphActor import Actor, Department, multicast
+from metrics import SimulationMetrics
+from replay import SchedulingRecorder, SchedulingReplayer
@@ -0,0 +1,161 @@
+from collections import deque
+from Queue import Queue
+
+
+class LatencyHistogram(object):
+    '''
+    A fixed-size histogram of message latencies, in ticks.
+    Bucket 0 counts messages dequeued on the tick they arrived; bucket i counts latencies in [2^(i-1), 2^i).
+    Anything slower than the last bucket is counted in the last bucket.
+    '''
+    def __init__(self, buckets=16):
+        self.buckets = [0] * buckets
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, latency):
+        bucket = min(int(latency).bit_length(), len(self.buckets) - 1)
+        self.buckets[bucket] += 1
+        self.count += 1
+        self.total += latency
+        self.max = max(self.max, latency)
+
+    @property
+    def mean(self):
+        if self.count is 0:
+            return 0.0
+        return float(self.total) / self.count
+
+
+class ActorUsage(object):
+    '''
+    Busy and idle tick counts for a single actor, alongside the most recent ticks' busy flags.
+    '''
+    def __init__(self, history):
+        self.busy_ticks = 0
+        self.idle_ticks = 0
+        self.recent = deque(maxlen=history)
+        self.last_tick = None
+
+    @property
+    def utilisation(self):
+        ticks = self.busy_ticks + self.idle_ticks
+        if ticks is 0:
+            return 0.0
+        return float(self.busy_ticks) / ticks
+
+
+class MetricsQueue(Queue):
+    '''
+    A Queue which stamps each message with the tick it was enqueued on, so the tick it's dequeued on gives its latency.
+    Stamping happens in _put and _get, which Queue calls while holding its lock.
+    '''
+    def __init__(self, metrics, owner, maxsize=0):
+        self.metrics = metrics
+        self.owner = owner
+        Queue.__init__(self, maxsize)
+
+    def _put(self, item):
+        self.queue.append((self.metrics.current_tick, item))
+
+    def _get(self):
+        enqueued_at, item = self.queue.popleft()
+        self.metrics.latency(self.owner).record(self.metrics.current_tick - enqueued_at)
+        return item
+
+
+class SimulationMetrics(object):
+    '''
+    Tracks, per tick, the depth of actor inboxes and department work queues, message latency, and busy versus idle
+    ticks for each actor. Everything is kept in fixed-size ring buffers or histograms, so it can be left on for long
+    runs and queried while the simulation is going.
+    Time is read from the au Clock the actors are synchronised against. The metrics listen to that clock too, and
+    sample queue depths once per tick when it asks them to perform; create them before the actors to sample each
+    tick's queues before any actor has taken work from them.
+    '''
+    def __init__(self, clock, history=256):
+        self.clock = clock
+        self.history = history
+        self.depths = dict()
+        self.latencies = dict()
+        self.usage = dict()
+        self.queues = dict()
+        clock.add_listener(self)
+
+    @property
+    def current_tick(self):
+        return self.clock.ticks_passed
+
+    def watch_actor(self, actor):
+        actor.inbox = self.__watch_queue(actor, actor.inbox)
+        self.usage[actor] = ActorUsage(self.history)
+        actor.metrics = self
+
+    def watch_department(self, department):
+        department.department_work_queue = self.__watch_queue(department, department.department_work_queue)
+
+    def __watch_queue(self, owner, queue):
+        watched_queue = MetricsQueue(self, owner)
+
+        # Keep anything already waiting, in order.
+        while not queue.empty():
+            watched_queue.put(queue.get(block=True))
+
+        self.queues[owner] = watched_queue
+        self.depths[owner] = deque(maxlen=self.history)
+        self.latencies[owner] = LatencyHistogram()
+        return watched_queue
+
+    def sample_queue_depths(self):
+        tick = self.current_tick
+        for owner, queue in self.queues.items():
+            self.depths[owner].append((tick, queue.qsize()))
+
+    def perform(self):
+        while True:
+            self.sample_queue_depths()
+            yield
+
+    def record_actor_tick(self, actor, busy):
+        '''
+        Called by an actor every time it performs. Steps taken within a tick the actor's already reported are ignored,
+        so zero-cost steps don't count as extra ticks.
+        '''
+        tick = self.current_tick
+        usage = self.usage[actor]
+        if usage.last_tick == tick:
+            return
+
+        usage.last_tick = tick
+        usage.recent.append(busy)
+        if busy:
+            usage.busy_ticks += 1
+        else:
+            usage.idle_ticks += 1
+
+    def queue_depths(self, owner):
+        '''
+        :param owner: A watched actor or department.
+        :return: A list of (tick, depth) pairs for the most recently sampled ticks, oldest first.
+        '''
+        return list(self.depths[owner])
+
+    def latency(self, owner):
+        return self.latencies[owner]
+
+    def utilisation(self, actor):
+        return self.usage[actor].utilisation
+
+    def recent_activity(self, actor):
+        '''
+        :param actor: A watched actor.
+        :return: A list of flags for the actor's most recent ticks, oldest first: True if it was busy, False if idle.
+        '''
+        return list(self.usage[actor].recent)
+
+    def busiest_queues(self):
+        '''
+        :return: Watched actors and departments, ordered by their current queue depth, deepest first.
+        '''
+        return sorted(self.queues.keys(), key=lambda owner: self.queues[owner].qsize(), reverse=True)
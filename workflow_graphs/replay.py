@@ -0,0 +1,182 @@
+from collections import deque
+from workflow_utilities import ReplayDivergenceException
+
+# Kinds of event in a scheduling log.
+WORKFLOW_CHOICE = 0
+DECISION = 1
+
+# Where an actor took a workflow from, when it wasn't one of its departments (which are logged by index).
+INBOX = -1
+IDLE = None
+
+
+def encode_source(actor, source):
+    if source is None:
+        return IDLE
+    if source is actor.inbox:
+        return INBOX
+    for dept_index in range(len(actor.departments)):
+        if source is actor.departments[dept_index].department_work_queue:
+            return dept_index
+
+
+def decode_source(actor, encoded_source):
+    if encoded_source is IDLE:
+        return None
+    if encoded_source == INBOX:
+        return actor.inbox
+    if encoded_source >= len(actor.departments):
+        raise ReplayDivergenceException("Replay expected actor " + str(actor.name) + " to have a department at index "
+                                        + str(encoded_source))
+    return actor.departments[encoded_source].department_work_queue
+
+
+def decision_name(condition):
+    # A cheap way to tell which decision a result came from. Lambdas all share a name, so give conditions real names.
+    return getattr(condition, "__name__", type(condition).__name__)
+
+
+def same_event(event, kind, value, tick):
+    '''
+    Whether an event logged on `tick` would just repeat `event`. Repeats only count within the event's last tick or
+    the one after it, so each run of identical events covers a contiguous span of ticks.
+    '''
+    logged_kind, logged_value, first_tick, last_tick, count = event
+    return logged_kind == kind \
+        and type(logged_value) is type(value) and logged_value == value \
+        and tick in (last_tick, last_tick + 1)
+
+
+class RecordingSchedule(object):
+    '''
+    Makes an actor's scheduling decisions as normal, appending each to a log as
+    `(kind, value, first_tick, last_tick, count)`: `(WORKFLOW_CHOICE, source, ...)` whenever get_next_workflow picks
+    where to take work from, and `(DECISION, (condition name, result), ...)` whenever a decision's condition is
+    evaluated. Identical events on the same or consecutive ticks (like an idle actor choosing to idle every tick) are
+    logged once, spanning `first_tick` to `last_tick`, with `count` saying how many times they happened.
+    '''
+    def __init__(self, log, clock):
+        self.log = log
+        self.clock = clock
+
+    def __record(self, kind, value):
+        tick = self.clock.ticks_passed
+        if len(self.log) is not 0 and same_event(self.log[-1], kind, value, tick):
+            logged_kind, logged_value, first_tick, last_tick, count = self.log[-1]
+            self.log[-1] = (logged_kind, logged_value, first_tick, tick, count + 1)
+        else:
+            self.log.append((kind, value, tick, tick, 1))
+
+    def choose_source(self, actor):
+        source = actor.next_work_source()
+        self.__record(WORKFLOW_CHOICE, encode_source(actor, source))
+        return source
+
+    def decide(self, decision, ctx, actor, env):
+        condition = decision["condition_function"]
+        result = condition(ctx, actor, env)
+        self.__record(DECISION, (decision_name(condition), result))
+        return result
+
+
+class ReplayingSchedule(object):
+    '''
+    Feeds an actor the scheduling decisions from a recorded log, without running any condition functions.
+    Once the log runs out, or the clock reaches `until_tick`, the actor carries on making its own decisions, so a run
+    can be replayed up to some tick of interest and then continue live from there.
+    Anything that doesn't line up with the log (the wrong kind of event, tick or decision, a result no case matches,
+    or a department or queue that isn't there) raises a ReplayDivergenceException.
+    '''
+    def __init__(self, log, clock, until_tick=None):
+        self.remaining = deque(log)
+        self.repeats_taken = 0  # How many of the first remaining event's repeats we've already replayed.
+        self.clock = clock
+        self.until_tick = until_tick
+
+    @property
+    def exhausted(self):
+        return len(self.remaining) is 0
+
+    @property
+    def replaying(self):
+        if self.exhausted:
+            return False
+        return self.until_tick is None or self.clock.ticks_passed < self.until_tick
+
+    def __next_event(self, expected_kind):
+        kind, value, first_tick, last_tick, count = self.remaining[0]
+        tick = self.clock.ticks_passed
+        if kind != expected_kind:
+            raise ReplayDivergenceException("Replay expected event kind " + str(expected_kind) + " on tick " +
+                                            str(tick) + " but the log has " + str(kind) + " from tick " +
+                                            str(first_tick))
+        if not first_tick <= tick <= last_tick:
+            raise ReplayDivergenceException("Replay reached an event on tick " + str(tick) +
+                                            " which was logged for ticks " + str(first_tick) + " to " + str(last_tick))
+
+        self.repeats_taken += 1
+        if self.repeats_taken == count:
+            self.remaining.popleft()
+            self.repeats_taken = 0
+        return value
+
+    def choose_source(self, actor):
+        if not self.replaying:
+            return actor.next_work_source()
+
+        source = decode_source(actor, self.__next_event(WORKFLOW_CHOICE))
+        if source is not None and source.empty():
+            raise ReplayDivergenceException("Replay expected work waiting for actor " + str(actor.name))
+        return source
+
+    def decide(self, decision, ctx, actor, env):
+        condition = decision["condition_function"]
+        if not self.replaying:
+            return condition(ctx, actor, env)
+
+        logged_name, result = self.__next_event(DECISION)
+        if logged_name != decision_name(condition):
+            raise ReplayDivergenceException("Replay reached decision " + decision_name(condition) +
+                                            " but the log has a result for " + logged_name)
+        if not any(result == case_path[0] for case_path in decision["cases"]):
+            raise ReplayDivergenceException("Replayed result " + repr(result) + " matches no case of decision " +
+                                            logged_name)
+        return result
+
+
+class SchedulingRecorder(object):
+    '''
+    Records the scheduling decisions of every actor watched, in a compact log per actor.
+    Logs are lists of small tuples in the order the actors were watched, so they can be pickled and handed to a
+    SchedulingReplayer later.
+    '''
+    def __init__(self):
+        self.logs = list()
+
+    def watch_actor(self, actor):
+        log = list()
+        self.logs.append(log)
+        actor.scheduler = RecordingSchedule(log, actor.clock)
+
+
+class SchedulingReplayer(object):
+    '''
+    Replays logs from a SchedulingRecorder. Actors must be set up as they were for the recording and watched in the
+    same order, so each gets its own log back. If `until_tick` is given, actors go live from that tick onwards.
+    '''
+    def __init__(self, logs, until_tick=None):
+        self.logs = logs
+        self.until_tick = until_tick
+        self.schedules = list()
+
+    def watch_actor(self, actor):
+        if len(self.schedules) >= len(self.logs):
+            raise ReplayDivergenceException("No log to replay for actor " + str(actor.name) + "; only " +
+                                            str(len(self.logs)) + " actors were recorded")
+        schedule = ReplayingSchedule(self.logs[len(self.schedules)], actor.clock, self.until_tick)
+        self.schedules.append(schedule)
+        actor.scheduler = schedule
+
+    @property
+    def exhausted(self):
+        return all(schedule.exhausted for schedule in self.schedules)
@@ -12,6 +12,8 @@ class WorkflowGraph(object):
         self.action_currently_executing = None  # The index of the action currently being executed
         self.label_action_mapping = {}
         self.decision_building_stack = list()
+        self.path_being_built = self.graph  # The list new steps are added to: the graph, or a case of a decision.
+        self.last_action_added = None  # Tracked as we build, so labelling doesn't walk back down the graph.
 
     def run_workflow(self, *args, **kwargs):
         self(*args, **kwargs)
@@ -20,19 +22,13 @@ class WorkflowGraph(object):
     def __currently_building_a_decision(self):
         return len(self.decision_building_stack) is not 0
 
-    @property
-    def __last_action_added(self):
-        activity = self.graph
-        activity = activity[-1]
-
-        # If we have nested decisions, this should take care of them.
-        while type(activity) is dict or type(activity) is list:
-            if type(activity) is list:
-                activity = activity[-1]
-            else:
-                activity = activity["cases"][-1][-1]
+    def __add_step(self, next_action):
+        if self.path_being_built is None:
+            raise BadWorkflowFormation("Steps in a decision must follow a when(); none has been given yet.")
 
-        return activity
+        last_action = last_action_in(next_action)
+        self.path_being_built.append(convert_to_actions(next_action))
+        self.last_action_added = last_action
 
     def index_of(self, action):
         item_not_in_path = ItemNotInPath()
@@ -71,23 +67,28 @@ class WorkflowGraph(object):
 
     @cascade
     def then(self, next_action):
+        self.__add_step(next_action)
 
-        next_action = convert_to_actions(next_action)
-
-        if not self.__currently_building_a_decision:
-            self.graph.append(next_action)
-        else:
-            self.decision_building_stack[-1]["cases"][-1].append(next_action)
+    @cascade
+    def then_all(self, next_actions):
+        '''
+        Adds each of an iterable of actions (or WorkflowGraphs) in turn, as if `then` were called on each.
+        '''
+        for next_action in next_actions:
+            self.__add_step(next_action)
 
     @cascade
     def decide_on(self, condition):
         new_decision = {"condition_function": condition,
                         "cases":              list()}
         self.decision_building_stack.append(new_decision)
+        self.path_being_built = None  # Nothing can be added until when() gives us a case to add to.
 
     @cascade
     def when(self, case):
-        self.decision_building_stack[-1]["cases"].append([case])
+        case_path = [case]
+        self.decision_building_stack[-1]["cases"].append(case_path)
+        self.path_being_built = case_path
 
     @cascade
     def begin_with(self, first_action):
@@ -96,7 +97,36 @@ class WorkflowGraph(object):
     @cascade
     def join(self):
         fully_built_decision = self.decision_building_stack.pop()
-        self.then(fully_built_decision)
+
+        if self.__currently_building_a_decision:
+            self.path_being_built = self.decision_building_stack[-1]["cases"][-1]
+        else:
+            self.path_being_built = self.graph
+
+        # The decision's last action is whatever was last added to its final case, so last_action_added stands.
+        self.path_being_built.append(fully_built_decision)
+
+    @cascade
+    def decide_between(self, condition, cases):
+        '''
+        Builds a whole decision at once, equivalent to decide_on(condition), a when/then for each case, and join().
+        :param condition: The condition function to decide on.
+        :param cases: A dict (or iterable of pairs) mapping each case to the step to take (an action or WorkflowGraph),
+        or to any other iterable of steps.
+        Cases equal to anything (like anything_else) are always tried last, whatever order they're given in.
+        '''
+        if isinstance(cases, dict):
+            cases = cases.items()
+        cases = sorted(cases, key=lambda case_and_steps: isinstance(case_and_steps[0], EqualToAnything))
+
+        self.decide_on(condition)
+        for case, steps in cases:
+            self.when(case)
+            if type(steps) is not WorkflowGraph and hasattr(steps, "__iter__"):
+                self.then_all(steps)
+            else:
+                self.then(steps)
+        self.join()
 
     @cascade
     def move_to_step_called(self, label):
@@ -111,8 +141,7 @@ class WorkflowGraph(object):
 
     @cascade
     def call_that_step(self, label):
-        self.label_action_mapping[label] = self.__last_action_added
-        pass
+        self.label_action_mapping[label] = self.last_action_added
 
     # For code reuse, because we navigate the graph by index lots!
     def at_index(self, index):
@@ -145,7 +174,11 @@ class WorkflowGraph(object):
     def __call__(self, context, actor):
         [act(ctx, _actor, env) for act, ctx, _actor, env in self.yield_actions(context, actor)]
 
-    def yield_actions(self, ctx, actor):
+    def yield_actions(self, ctx, actor, scheduler=None):
+        '''
+        :param scheduler: If given, decisions are resolved through `scheduler.decide()`, so their conditions can be
+        recorded or replayed (see replay.py).
+        '''
 
         self.action_currently_executing = [0]  # Begin at the beginning of the graph!
 
@@ -163,7 +196,10 @@ class WorkflowGraph(object):
 
                 if type(curr_action) is dict:
                     condition_func = curr_action["condition_function"]
-                    case = condition_func(ctx, actor, WorkflowGraph.environment)
+                    if scheduler is None:
+                        case = condition_func(ctx, actor, WorkflowGraph.environment)
+                    else:
+                        case = scheduler.decide(curr_action, ctx, actor, WorkflowGraph.environment)
                     matched_yet = False
 
                     for case_path in curr_action["cases"]:
@@ -201,6 +237,21 @@ class WorkflowGraph(object):
 
 
 
+def last_action_in(action):
+    # A WorkflowGraph already knows its last action, so only raw lists and decisions need walking.
+    if type(action) is WorkflowGraph:
+        return action.last_action_added
+
+    # If we have nested decisions, this should take care of them.
+    while type(action) is dict or type(action) is list:
+        if type(action) is list:
+            action = action[-1]
+        else:
+            action = action["cases"][-1][-1]
+
+    return action
+
+
 def convert_to_actions(action):
     # Convert WorkflowGraphs to their list-representation, which is a valid action
     if type(action) is WorkflowGraph:
@@ -1,4 +1,6 @@
 import functools
+from collections import OrderedDict
+from copy import deepcopy
 from au import default_cost
 
 def cascade(method):
@@ -47,6 +49,20 @@ class ItemNotInPath:
     pass
 
 
+class NotCached:
+    '''
+    A sentinel for a result missing from a PureFunctionCache, as None is a perfectly good result to cache.
+    '''
+    pass
+
+
+class MissingKey:
+    '''
+    A sentinel standing in for an input key that's absent in a PureFunctionCache key, so it isn't confused with None.
+    '''
+    pass
+
+
 def dummy_action_generator(cost=0):
     '''
     Generate new functions so they're different places in memory (and different dummy actions won't be seen as
@@ -75,6 +91,106 @@ class CouldNotParseIndexException(Exception):
     pass
 
 
+class ReplayDivergenceException(Exception):
+    pass
+
+
+class PureFunctionCache(object):
+    '''
+    A bounded, least-recently-used cache of the results of a pure action or condition.
+    Results are keyed on the values of the declared input keys of ctx, the actor state and the environment.
+    '''
+    def __init__(self, ctx_keys=(), actor_keys=(), env_keys=(), max_size=128):
+        self.ctx_keys = tuple(ctx_keys)
+        self.actor_keys = tuple(actor_keys)
+        self.env_keys = tuple(env_keys)
+        self.max_size = max_size
+        self.results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key_for(self, ctx, actor, env):
+        return (tuple(ctx.get(key, MissingKey) for key in self.ctx_keys),
+                tuple(actor.get(key, MissingKey) for key in self.actor_keys),
+                tuple(env.get(key, MissingKey) for key in self.env_keys))
+
+    def lookup(self, key):
+        '''
+        :param key: A key built by key_for().
+        :return: The cached result, or NotCached if we've not seen the key.
+        '''
+        if key not in self.results:
+            self.misses += 1
+            return NotCached
+        self.hits += 1
+        result = self.results.pop(key)
+        self.results[key] = result  # Re-insert, so the key is now the most recently used.
+        return result
+
+    def store(self, key, result):
+        self.results[key] = result
+        while len(self.results) > self.max_size:
+            self.results.popitem(last=False)
+
+    def clear(self):
+        self.results.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+def pure(ctx_keys=(), actor_keys=(), env_keys=(), writes_ctx=(), writes_actor=(), writes_env=(), max_size=128):
+    '''
+    Marks an action or condition as a pure function of the named keys of ctx, the actor state and the environment.
+    The decorated function is only called when those inputs take values we haven't cached a result for;
+    otherwise the cached result is returned without running the function.
+    Actions' return values are thrown away, so an action's effects must be declared as the keys it writes: their
+    values are copied into the cache alongside the result and copies written back on a hit. Undeclared writes are
+    lost on a hit.
+    The cache is exposed as `func.cache`, with `hits` and `misses` counters.
+    :param ctx_keys: Keys of the context the function reads.
+    :param actor_keys: Keys of the actor state the function reads.
+    :param env_keys: Keys of the environment the function reads.
+    :param writes_ctx: Keys of the context the function writes.
+    :param writes_actor: Keys of the actor state the function writes.
+    :param writes_env: Keys of the environment the function writes.
+    :param max_size: The number of results to keep before evicting the least recently used.
+    :return: A decorator producing the memoised function.
+    '''
+    writes = [(0, tuple(writes_ctx)), (1, tuple(writes_actor)), (2, tuple(writes_env))]
+
+    def _pure(func):
+        cache = PureFunctionCache(ctx_keys, actor_keys, env_keys, max_size)
+
+        @functools.wraps(func)
+        def memoised(ctx, actor, env):
+            try:
+                key = cache.key_for(ctx, actor, env)
+                cached = cache.lookup(key)
+            except TypeError:
+                # Unhashable inputs can't be cached, so just run the function.
+                return func(ctx, actor, env)
+
+            states = (ctx, actor, env)
+            if cached is NotCached:
+                result = func(ctx, actor, env)
+                # Copied, so later changes to the written values can't reach back into the cache.
+                written = [(state_index, write_key, deepcopy(states[state_index][write_key]))
+                           for state_index, write_keys in writes
+                           for write_key in write_keys
+                           if write_key in states[state_index]]
+                cache.store(key, (result, written))
+                return result
+
+            result, written = cached
+            for state_index, write_key, value in written:
+                states[state_index][write_key] = deepcopy(value)
+            return result
+
+        memoised.cache = cache
+        return memoised
+    return _pure
+
+
 class EqualToAnything(object):
     def __eq__(self, other):
         return True